@@ -11,32 +11,66 @@ import sys
 import time
 import asyncio
 import logging
+import queue
+import atexit
 import re
 import json
+import hashlib
+import sqlite3
+from collections import OrderedDict
 from io import BytesIO
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime, timezone, timedelta
-from typing import Optional, Set, List, Tuple, Dict
+from typing import Optional, List, Tuple, Dict
 
-import httpx
+import aiohttp
+from aiohttp.resolver import AsyncResolver, ThreadedResolver
 from PIL import Image
 from dotenv import load_dotenv
 from nostr_sdk import (
     Client, Filter, PublicKey, Event, RelayMessage,
     Kind, Timestamp, RelayUrl, init_logger, LogLevel, Nip19
 )
-from atproto import Client as BlueskyClient, client_utils, models
+from atproto import Client as BlueskyClient, models
+
+try:
+    # Faster JSON parsing for profile metadata
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+try:
+    # Optional: compiled DFA regex engine for faster image URL scanning
+    import hyperscan
+except ImportError:
+    hyperscan = None
 
 # Configure logging
+# Records are formatted by the QueueHandler and written by a listener thread
+# so file/stdout I/O doesn't block the event loop
+log_queue: queue.Queue = queue.Queue(-1)
+log_listener = QueueListener(
+    log_queue,
+    logging.FileHandler('bot.log'),
+    logging.StreamHandler(sys.stdout)
+)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
+    handlers=[QueueHandler(log_queue)]
 )
 logger = logging.getLogger('nostr-bluesky-bot')
 
+# Precompiled patterns used on every incoming note
+_IMAGE_RE = re.compile(r'https?://[^\s]+\.(?:jpe?g|png|gif|webp)', re.IGNORECASE)
+_MULTI_SPACE_RE = re.compile(r' +')
+_MULTI_NL_RE = re.compile(r'\n{3,}')
+_NEVENT_RE = re.compile(r'nostr:nevent1[qpzry9x8gf2tvdw0s3jn54khce6mua7l]+')
+_NPUB_RE = re.compile(r'nostr:((?:npub|nprofile)1[qpzry9x8gf2tvdw0s3jn54khce6mua7l]+)')
+
 
 class NotificationHandler:
     """Handler for Nostr notifications"""
@@ -76,23 +110,63 @@ class NostrToBlueskyBot:
 
         if npub:
             self.nostr_pubkey = PublicKey.parse(npub)
-            logger.info(f"Monitoring Nostr npub: {npub}")
+            logger.info("Monitoring Nostr npub: %s", npub)
         elif hex_pubkey:
             self.nostr_pubkey = PublicKey.parse(hex_pubkey)
-            logger.info(f"Monitoring Nostr pubkey: {hex_pubkey}")
+            logger.info("Monitoring Nostr pubkey: %s", hex_pubkey)
         else:
             raise ValueError("Must provide either NOSTR_NPUB or NOSTR_PUBKEY")
 
         # Initialize clients
         self.nostr_client: Optional[Client] = None
         self.bluesky_client: Optional[BlueskyClient] = None
+        self.http_client: Optional[aiohttp.ClientSession] = None
 
         # Track processed events to avoid duplicates
-        self.processed_events: Set[str] = set()
+        # Bounded LRU so memory stays flat over long uptimes
+        self.processed_events: OrderedDict[bytes, None] = OrderedDict()
+        self.max_processed_events = 10000
 
-        # Track bot start time to avoid posting old notes
+        # Only post notes from now on, unless load_processed_events() moves this
+        # back to the newest posted note to backfill notes missed while down
         self.start_time = Timestamp.now()
 
+        # Persist posted event IDs so a restart resumes where it left off
+        # instead of reprocessing (and possibly reposting) recent notes
+        self.processed_db_path = os.getenv('PROCESSED_DB', 'processed.db')
+        self.processed_db_retention = 24 * 60 * 60
+        self.processed_db = sqlite3.connect(self.processed_db_path)
+        self.load_processed_events()
+
+        self.start_secs = self.start_time.as_secs()
+
+        # Compile the image URL pattern once if hyperscan is available
+        self.image_db = None
+        if hyperscan is not None:
+            self.image_db = hyperscan.Database()
+            self.image_db.compile(
+                expressions=[_IMAGE_RE.pattern.encode()],
+                flags=[
+                    hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SOM_LEFTMOST
+                    | hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP
+                ],
+            )
+
+        # Cache resolved profile metadata by hex pubkey: (fetched_at, metadata or None)
+        # Misses are cached for a shorter time so dead profiles aren't re-queried per note
+        self.profile_cache: OrderedDict[str, Tuple[float, Optional[Dict[str, str]]]] = OrderedDict()
+        self.profile_cache_ttl = 3600.0
+        self.profile_cache_miss_ttl = 60.0
+        self.max_profile_cache = 1024
+
+        # Cache uploaded Bluesky blobs by image URL and by content hash
+        # so reposted images aren't downloaded/uploaded again. Blobs are only
+        # cached once a post referencing them succeeds (unreferenced blobs
+        # are garbage collected by the PDS)
+        self.blob_cache_by_url: OrderedDict[str, Tuple[str, dict]] = OrderedDict()
+        self.blob_cache_by_hash: OrderedDict[str, dict] = OrderedDict()
+        self.max_blob_cache = 256
+
     def is_reply(self, event: Event) -> bool:
         """Check if a note is a reply by examining its tags"""
         tags = event.tags()
@@ -104,6 +178,46 @@ class NostrToBlueskyBot:
         # If there are any event IDs, this is a reply
         return len(event_ids) > 0
 
+    def load_processed_events(self):
+        """Load recently posted event IDs from disk and resume from the newest one"""
+        self.processed_db.execute('CREATE TABLE IF NOT EXISTS seen (id BLOB PRIMARY KEY, ts INTEGER)')
+
+        # Forget anything older than the retention window
+        cutoff = self.start_time.as_secs() - self.processed_db_retention
+        self.processed_db.execute('DELETE FROM seen WHERE ts < ?', (cutoff,))
+        self.processed_db.commit()
+
+        rows = self.processed_db.execute(
+            'SELECT id, ts FROM seen ORDER BY ts DESC LIMIT ?', (self.max_processed_events,)
+        ).fetchall()
+
+        if not rows:
+            return
+
+        # Oldest first so LRU eviction order matches event age
+        for event_key, _ in reversed(rows):
+            self.mark_processed(event_key)
+
+        last_seen = rows[0][1]
+        self.start_time = Timestamp.from_secs(last_seen)
+        logger.info("Loaded %s processed event(s), resuming from %s",
+                    len(rows), datetime.fromtimestamp(last_seen, tz=timezone.utc))
+
+    def save_processed(self, event_key: bytes, created_at: int):
+        """Persist a posted event ID"""
+        try:
+            self.processed_db.execute('INSERT OR IGNORE INTO seen VALUES (?, ?)', (event_key, created_at))
+            self.processed_db.commit()
+        except sqlite3.Error as e:
+            logger.warning("Failed to persist processed event: %s", e)
+
+    def mark_processed(self, event_key: bytes):
+        """Record an event ID as processed, evicting the oldest beyond the cap"""
+        self.processed_events[event_key] = None
+        self.processed_events.move_to_end(event_key)
+        if len(self.processed_events) > self.max_processed_events:
+            self.processed_events.popitem(last=False)
+
     async def connect_nostr(self):
         """Connect to Nostr relay and set up subscription"""
         logger.info("Connecting to Nostr relay...")
@@ -117,7 +231,7 @@ class NostrToBlueskyBot:
         # Add primary relay for event subscription
         relay_url = RelayUrl.parse(self.nostr_relay)
         await self.nostr_client.add_relay(relay_url)
-        logger.info(f"Added primary relay: {self.nostr_relay}")
+        logger.info("Added primary relay: %s", self.nostr_relay)
 
         # Add additional popular relays for metadata lookups
         # These improve the chances of finding user profile information
@@ -132,9 +246,9 @@ class NostrToBlueskyBot:
             try:
                 relay_url = RelayUrl.parse(relay)
                 await self.nostr_client.add_relay(relay_url)
-                logger.info(f"Added metadata relay: {relay}")
+                logger.info("Added metadata relay: %s", relay)
             except Exception as e:
-                logger.warning(f"Failed to add relay {relay}: {e}")
+                logger.warning("Failed to add relay %s: %s", relay, e)
 
         # Connect to all relays
         await self.nostr_client.connect()
@@ -145,39 +259,85 @@ class NostrToBlueskyBot:
         logger.info("Connecting to Bluesky...")
 
         self.bluesky_client = BlueskyClient()
-        self.bluesky_client.login(self.bluesky_username, self.bluesky_password)
+        # The atproto client is synchronous, run it off the event loop
+        await asyncio.to_thread(self.bluesky_client.login, self.bluesky_username, self.bluesky_password)
 
-        logger.info(f"Authenticated with Bluesky as {self.bluesky_username}")
+        logger.info("Authenticated with Bluesky as %s", self.bluesky_username)
+
+    async def connect_http(self):
+        """Create the shared HTTP client used for image downloads"""
+        # Reused across downloads so connections are kept alive between images.
+        # DNS goes through aiodns so lookups don't tie up the event loop or a thread
+        try:
+            resolver = AsyncResolver()
+        except Exception as e:
+            # Some aiodns versions can't run on the Windows Proactor event loop
+            logger.warning("Async DNS resolver unavailable (%s), falling back to threaded resolver", e)
+            resolver = ThreadedResolver()
+
+        connector = aiohttp.TCPConnector(resolver=resolver, limit=8, ttl_dns_cache=300)
+        self.http_client = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=30.0),
+        )
 
     def extract_image_urls(self, content: str) -> List[str]:
         """Extract image URLs from note content"""
-        # Common image URL patterns (jpg, jpeg, png, gif, webp)
-        image_pattern = r'https?://[^\s]+\.(?:jpg|jpeg|png|gif|webp|JPG|JPEG|PNG|GIF|WEBP)'
+        # Most notes have no links at all, skip the regex entirely
+        if '://' not in content:
+            return []
 
-        urls = re.findall(image_pattern, content)
+        # Common image URL patterns (jpg, jpeg, png, gif, webp)
+        if self.image_db is not None:
+            urls = self.scan_image_urls(content)
+        else:
+            urls = _IMAGE_RE.findall(content)
 
         # Clean up URLs (remove trailing punctuation that might be part of sentence)
-        cleaned_urls = []
-        for url in urls:
-            # Remove trailing punctuation
-            url = re.sub(r'[.,;:!?)\]]+$', '', url)
-            cleaned_urls.append(url)
+        # str.rstrip does this without going through the regex engine
+        return [url.rstrip('.,;:!?)]') for url in urls]
 
-        return cleaned_urls
+    def scan_image_urls(self, content: str) -> List[str]:
+        """
+        Find image URLs using the compiled hyperscan database
+        Returns the same matches as _IMAGE_RE.findall
+        """
+        data = content.encode('utf-8')
+        matches: List[Tuple[int, int]] = []
+
+        def on_match(match_id, start, end, flags, context):
+            context.append((start, end))
+
+        self.image_db.scan(data, match_event_handler=on_match, context=matches)
+
+        # Hyperscan reports every possible end offset; keep the longest match
+        # for each leftmost start and skip overlaps, as re.findall does
+        urls = []
+        last_end = -1
+        for start, end in sorted(matches, key=lambda m: (m[0], -m[1])):
+            if start < last_end:
+                continue
+            urls.append(data[start:end].decode('utf-8'))
+            last_end = end
+
+        return urls
 
     def remove_image_urls(self, content: str, image_urls: List[str]) -> str:
         """Remove image URLs from content since they'll be attached as images"""
-        cleaned_content = content
+        if not image_urls:
+            return content
 
-        for url in image_urls:
-            # Remove the URL (with or without trailing punctuation)
-            cleaned_content = re.sub(re.escape(url) + r'[.,;:!?)\]]*', '', cleaned_content)
+        # Remove all URLs (with or without trailing punctuation) in a single pass
+        # Longest first so a URL that prefixes another doesn't win the alternation
+        urls = sorted(set(image_urls), key=len, reverse=True)
+        url_pattern = re.compile('(?:' + '|'.join(re.escape(url) for url in urls) + r')[.,;:!?)\]]*')
+        cleaned_content = url_pattern.sub('', content)
 
         # Clean up extra whitespace
         # Remove multiple spaces
-        cleaned_content = re.sub(r' +', ' ', cleaned_content)
+        cleaned_content = _MULTI_SPACE_RE.sub(' ', cleaned_content)
         # Remove multiple newlines (keep max 2 consecutive)
-        cleaned_content = re.sub(r'\n{3,}', '\n\n', cleaned_content)
+        cleaned_content = _MULTI_NL_RE.sub('\n\n', cleaned_content)
         # Remove leading/trailing whitespace
         cleaned_content = cleaned_content.strip()
 
@@ -185,24 +345,24 @@ class NostrToBlueskyBot:
 
     def is_quote_event(self, content: str) -> bool:
         """Check if a note is a quote event by looking for nostr:nevent references"""
+        if 'nostr:nevent1' not in content:
+            return False
+
         # Pattern to match nostr:nevent followed by bech32 encoded data
-        nevent_pattern = r'nostr:nevent1[qpzry9x8gf2tvdw0s3jn54khce6mua7l]+'
-        return bool(re.search(nevent_pattern, content))
+        return bool(_NEVENT_RE.search(content))
 
     def extract_npub_mentions(self, content: str) -> List[str]:
         """Extract nostr:npub and nostr:nprofile mentions from content"""
         # Pattern to match nostr:npub or nostr:nprofile followed by bech32 encoded data
         # npub1... for public keys
         # nprofile1... for profiles (includes pubkey + optional relays)
-        mention_pattern = r'nostr:((?:npub|nprofile)1[qpzry9x8gf2tvdw0s3jn54khce6mua7l]+)'
-        matches = re.findall(mention_pattern, content)
-        return matches
+        if 'nostr:n' not in content:
+            return []
 
-    async def fetch_profile_metadata(self, identifier: str) -> Optional[Dict[str, str]]:
-        """
-        Fetch profile metadata for a given npub or nprofile from connected relays
-        Returns dict with 'name' and 'display_name' fields or None if failed
-        """
+        return _NPUB_RE.findall(content)
+
+    def identifier_to_pubkey(self, identifier: str) -> Optional[PublicKey]:
+        """Parse an npub or nprofile identifier into a public key"""
         try:
             # Parse the identifier (npub or nprofile) to get the public key
             nip19_obj = Nip19.from_bech32(identifier)
@@ -210,48 +370,135 @@ class NostrToBlueskyBot:
 
             # Extract public key based on the type
             if enum_obj.is_pubkey():
-                pubkey = enum_obj.pubkey
+                return enum_obj.pubkey
             elif enum_obj.is_profile():
-                pubkey = enum_obj.nprofile.public_key()
-            else:
-                logger.warning(f"Unsupported NIP-19 type for identifier: {identifier[:16]}...")
-                return None
+                return enum_obj.nprofile.public_key()
 
-            logger.debug(f"Querying connected relays for metadata: {identifier[:16]}...")
+            logger.warning("Unsupported NIP-19 type for identifier: %s...", identifier[:16])
+            return None
 
-            # Fetch metadata using the SDK's built-in method
-            # This will query all connected relays
-            metadata = await self.nostr_client.fetch_metadata(pubkey, timedelta(seconds=5))
+        except Exception as e:
+            logger.warning("Failed to parse identifier %s...: %s", identifier[:16], e)
+            return None
 
-            if not metadata:
-                logger.warning(f"No metadata found for {identifier} on any connected relay")
-                return None
+    def parse_profile_metadata(self, content: str) -> Optional[Dict[str, str]]:
+        """
+        Parse kind 0 metadata content
+        Returns dict with 'name' and 'display_name' fields or None if unusable
+        """
+        try:
+            # orjson.JSONDecodeError subclasses json.JSONDecodeError
+            data = json_loads(content)
 
-            # Parse the metadata JSON to extract name/display_name
-            try:
-                metadata_json = metadata.as_json()
-                data = json.loads(metadata_json)
+            display_name = data.get('display_name')
+            name = data.get('name')
 
-                display_name = data.get('display_name')
-                name = data.get('name')
+            # Use display_name if available, otherwise fall back to name
+            final_name = display_name or name
 
-                # Use display_name if available, otherwise fall back to name
-                final_name = display_name or name
+            if final_name:
+                return {'display_name': final_name, 'name': name or ''}
 
-                if final_name:
-                    logger.info(f"✓ Resolved {identifier[:16]}... → '{final_name}'")
-                    return {'display_name': final_name, 'name': name or ''}
+            logger.warning("Metadata has no name or display_name")
+            return None
+
+        except (json.JSONDecodeError, AttributeError) as e:
+            logger.warning("Failed to parse metadata: %s", e)
+            return None
+
+    def get_cached_profile(self, hex_key: str) -> Tuple[bool, Optional[Dict[str, str]]]:
+        """
+        Look up profile metadata in the cache
+        Returns (hit, metadata) where metadata is None for a cached miss
+        """
+        entry = self.profile_cache.get(hex_key)
+        if entry is None:
+            return (False, None)
+
+        fetched_at, metadata = entry
+        ttl = self.profile_cache_ttl if metadata else self.profile_cache_miss_ttl
+        if time.monotonic() - fetched_at >= ttl:
+            del self.profile_cache[hex_key]
+            return (False, None)
+
+        self.profile_cache.move_to_end(hex_key)
+        return (True, metadata)
+
+    def cache_profile(self, hex_key: str, metadata: Optional[Dict[str, str]]):
+        """Store profile metadata (or a miss) in the cache, evicting the oldest beyond the cap"""
+        self.profile_cache[hex_key] = (time.monotonic(), metadata)
+        self.profile_cache.move_to_end(hex_key)
+        if len(self.profile_cache) > self.max_profile_cache:
+            self.profile_cache.popitem(last=False)
+
+    async def fetch_profiles_metadata(self, identifiers: List[str]) -> Dict[str, Dict[str, str]]:
+        """
+        Fetch profile metadata for several npubs/nprofiles, using the cache
+        where possible and a single relay query for the rest
+        Returns dict mapping each resolved identifier to its metadata
+        """
+        # Map identifiers to hex pubkeys (an npub and nprofile may share a key)
+        identifier_keys: Dict[str, str] = {}
+        profiles: Dict[str, Dict[str, str]] = {}
+        pubkeys: Dict[str, PublicKey] = {}
+        for identifier in identifiers:
+            pubkey = self.identifier_to_pubkey(identifier)
+            if pubkey:
+                hex_key = pubkey.to_hex()
+                identifier_keys[identifier] = hex_key
+
+                # Only query relays for profiles not already cached
+                hit, metadata = self.get_cached_profile(hex_key)
+                if hit:
+                    if metadata:
+                        profiles[hex_key] = metadata
                 else:
-                    logger.warning(f"Metadata has no name or display_name")
-                    return None
+                    pubkeys[hex_key] = pubkey
 
-            except (json.JSONDecodeError, AttributeError) as e:
-                logger.warning(f"Failed to parse metadata: {e}")
-                return None
+        if pubkeys:
+            profiles.update(await self.query_profiles_metadata(pubkeys))
+
+        resolved: Dict[str, Dict[str, str]] = {}
+        for identifier, hex_key in identifier_keys.items():
+            if hex_key in profiles:
+                resolved[identifier] = profiles[hex_key]
+                logger.info("✓ Resolved %s... → '%s'", identifier[:16], profiles[hex_key]['display_name'])
+
+        return resolved
+
+    async def query_profiles_metadata(self, pubkeys: Dict[str, PublicKey]) -> Dict[str, Dict[str, str]]:
+        """
+        Query connected relays for kind 0 metadata of the given pubkeys and cache the results
+        Returns dict mapping hex pubkey to metadata for the profiles found
+        """
+        logger.debug("Querying connected relays for metadata of %s profile(s)", len(pubkeys))
 
+        try:
+            # One kind 0 request for all authors, sent to all connected relays
+            metadata_filter = Filter().authors(list(pubkeys.values())).kind(Kind(0)).limit(len(pubkeys))
+            events = await self.nostr_client.fetch_events(metadata_filter, timedelta(seconds=5))
         except Exception as e:
-            logger.warning(f"Failed to fetch metadata for {identifier}: {e}")
-            return None
+            # Don't cache transport failures, only genuine misses
+            logger.warning("Failed to fetch metadata: %s", e)
+            return {}
+
+        # Keep only the most recent metadata event per author
+        latest: Dict[str, Event] = {}
+        for event in events.to_vec():
+            hex_key = event.author().to_hex()
+            current = latest.get(hex_key)
+            if current is None or event.created_at().as_secs() > current.created_at().as_secs():
+                latest[hex_key] = event
+
+        profiles: Dict[str, Dict[str, str]] = {}
+        for hex_key in pubkeys:
+            event = latest.get(hex_key)
+            metadata = self.parse_profile_metadata(event.content()) if event else None
+            self.cache_profile(hex_key, metadata)
+            if metadata:
+                profiles[hex_key] = metadata
+
+        return profiles
 
     async def replace_npub_mentions(self, content: str) -> str:
         """
@@ -266,32 +513,33 @@ class NostrToBlueskyBot:
             return content
 
         unique_identifiers = list(set(identifiers))  # Deduplicate
-        logger.info(f"Found {len(identifiers)} mention(s) ({len(unique_identifiers)} unique) to resolve")
+        logger.info("Found %s mention(s) (%s unique) to resolve", len(identifiers), len(unique_identifiers))
+
+        # Fetch metadata for all unique identifiers in one request
+        profiles = await self.fetch_profiles_metadata(unique_identifiers)
 
-        # Create a copy of content to modify
-        modified_content = content
+        # Map each identifier to its replacement text
+        replacements: Dict[str, str] = {}
         resolved_count = 0
 
-        # Fetch metadata for each unique identifier
         for identifier in unique_identifiers:
-            metadata = await self.fetch_profile_metadata(identifier)
+            metadata = profiles.get(identifier)
 
             if metadata and metadata.get('display_name'):
-                display_name = metadata['display_name']
-                # Replace all occurrences of nostr:npub/nprofile with the display name
-                mention_pattern = f"nostr:{identifier}"
-                modified_content = modified_content.replace(mention_pattern, display_name)
+                replacements[identifier] = metadata['display_name']
                 resolved_count += 1
             else:
                 # If we can't fetch metadata, keep the identifier but remove the nostr: prefix
-                mention_pattern = f"nostr:{identifier}"
-                modified_content = modified_content.replace(mention_pattern, identifier)
-                logger.warning(f"✗ Could not resolve {identifier[:16]}..., keeping identifier")
+                replacements[identifier] = identifier
+                logger.warning("✗ Could not resolve %s..., keeping identifier", identifier[:16])
+
+        # Replace all nostr:npub/nprofile mentions in a single pass over the content
+        modified_content = _NPUB_RE.sub(lambda m: replacements[m.group(1)], content)
 
         if resolved_count > 0:
-            logger.info(f"Successfully resolved {resolved_count}/{len(unique_identifiers)} mentions")
+            logger.info("Successfully resolved %s/%s mentions", resolved_count, len(unique_identifiers))
         else:
-            logger.warning(f"Failed to resolve any mentions (0/{len(unique_identifiers)})")
+            logger.warning("Failed to resolve any mentions (0/%s)", len(unique_identifiers))
 
         return modified_content
 
@@ -336,159 +584,266 @@ class NostrToBlueskyBot:
 
         return (truncated, True)
 
+    def sniff_image_type(self, header: bytes) -> Optional[str]:
+        """Detect common image formats from their magic bytes, returns MIME type or None"""
+        if header.startswith(b'\x89PNG\r\n\x1a\n'):
+            return 'image/png'
+        if header.startswith(b'\xff\xd8\xff'):
+            return 'image/jpeg'
+        if header.startswith((b'GIF87a', b'GIF89a')):
+            return 'image/gif'
+        if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+            return 'image/webp'
+        return None
+
     async def download_image(self, url: str, max_size_mb: int = 10) -> Optional[Tuple[bytes, str]]:
         """
         Download an image from a URL
         Returns tuple of (image_bytes, mime_type) or None if failed
         """
+        max_bytes = max_size_mb * 1024 * 1024
+
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(url, follow_redirects=True)
+            # Stream the body so oversized files are abandoned early
+            async with self.http_client.get(url) as response:
                 response.raise_for_status()
 
                 # Check content type
                 content_type = response.headers.get('content-type', '')
                 if not content_type.startswith('image/'):
-                    logger.warning(f"URL is not an image: {url} (type: {content_type})")
+                    logger.warning("URL is not an image: %s (type: %s)", url, content_type)
                     return None
 
-                # Check size
-                content = response.content
-                size_mb = len(content) / (1024 * 1024)
-                if size_mb > max_size_mb:
-                    logger.warning(f"Image too large: {size_mb:.2f}MB (max: {max_size_mb}MB)")
+                # Check advertised size before reading anything
+                content_length = response.content_length or 0
+                if content_length > max_bytes:
+                    logger.warning("Image too large: %.2fMB (max: %sMB)", content_length / (1024 * 1024), max_size_mb)
                     return None
 
-                # Validate it's a real image by trying to open it
+                # Read in chunks, bailing out as soon as the cap is exceeded
+                chunks = []
+                total = 0
+                async for chunk in response.content.iter_chunked(65536):
+                    chunks.append(chunk)
+                    total += len(chunk)
+                    if total > max_bytes:
+                        logger.warning("Image too large: over %sMB", max_size_mb)
+                        return None
+
+            # Join once into the bytes we hand to the uploader
+            content = b''.join(chunks)
+            size_mb = len(content) / (1024 * 1024)
+
+            # Validate it's a real image, by magic bytes when possible
+            if not self.sniff_image_type(content[:12]):
+                # Unrecognised signature, fall back to trying to open it
+                # (BytesIO shares the bytes object rather than copying it)
                 try:
                     img = Image.open(BytesIO(content))
                     img.verify()
                 except Exception as e:
-                    logger.warning(f"Invalid image file: {e}")
+                    logger.warning("Invalid image file: %s", e)
                     return None
 
-                logger.info(f"Downloaded image: {url} ({size_mb:.2f}MB, {content_type})")
-                return (content, content_type)
+            logger.info("Downloaded image: %s (%.2fMB, %s)", url, size_mb, content_type)
+            return (content, content_type)
 
         except Exception as e:
-            logger.error(f"Failed to download image {url}: {e}")
+            logger.error("Failed to download image %s: %s", url, e)
             return None
 
     async def upload_image_to_bluesky(self, image_data: bytes) -> Optional[dict]:
         """Upload image to Bluesky and return the blob reference"""
         try:
-            # Upload the image blob
-            blob = self.bluesky_client.upload_blob(image_data)
+            # Upload the image blob on a worker thread (the client is synchronous)
+            blob = await asyncio.to_thread(self.bluesky_client.upload_blob, image_data)
             return blob
         except Exception as e:
-            logger.error(f"Failed to upload image to Bluesky: {e}")
+            logger.error("Failed to upload image to Bluesky: %s", e)
+            return None
+
+    def cache_blob(self, cache: OrderedDict, key: str, value):
+        """Store a blob reference in an LRU cache, evicting the oldest beyond the cap"""
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > self.max_blob_cache:
+            cache.popitem(last=False)
+
+    async def process_image(self, url: str, use_cache: bool = True) -> Optional[Tuple[dict, str, bool]]:
+        """
+        Download an image and upload it to Bluesky
+        Returns tuple of (blob, content_hash, from_cache) or None if failed
+        """
+        if use_cache:
+            entry = self.blob_cache_by_url.get(url)
+            if entry:
+                self.blob_cache_by_url.move_to_end(url)
+                logger.info("Reusing uploaded image for %s", url)
+                digest, blob = entry
+                return (blob, digest, True)
+
+        image_data = await self.download_image(url)
+        if not image_data:
             return None
 
+        image_bytes, mime_type = image_data
+
+        # Same bytes under a different URL, reuse the earlier upload
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        if use_cache:
+            blob = self.blob_cache_by_hash.get(digest)
+            if blob:
+                self.blob_cache_by_hash.move_to_end(digest)
+                logger.info("Reusing uploaded image with identical content for %s", url)
+                return (blob, digest, True)
+
+        blob = await self.upload_image_to_bluesky(image_bytes)
+        if not blob:
+            return None
+
+        return (blob, digest, False)
+
+    async def process_images(self, urls: List[str], use_cache: bool = True) -> List[Tuple[str, dict, str, bool]]:
+        """
+        Download and upload images concurrently, keeping the original URL order
+        Returns list of (url, blob, content_hash, from_cache) for the images that succeeded
+        """
+        # Each image is uploaded as soon as its download finishes,
+        # overlapping with the others
+        results = await asyncio.gather(*(self.process_image(url, use_cache) for url in urls))
+
+        return [(url, *result) for url, result in zip(urls, results) if result]
+
+    async def send_to_bluesky(self, content: str, processed_images: List[Tuple[str, dict, str, bool]]):
+        """Build and send a post with the given uploaded images, raises on failure"""
+        images = []
+        successfully_processed_urls = []
+
+        for url, blob, digest, from_cache in processed_images:
+            # Create image embed
+            images.append(models.AppBskyEmbedImages.Image(
+                alt="Image from Nostr",
+                image=blob.blob
+            ))
+            successfully_processed_urls.append(url)
+
+        # Remove image URLs from content since they're attached as images
+        post_content = content
+        if successfully_processed_urls:
+            post_content = self.remove_image_urls(content, successfully_processed_urls)
+            logger.info("Removed %s image URL(s) from text", len(successfully_processed_urls))
+
+        # Check and truncate content if needed
+        grapheme_count = self.count_graphemes(post_content)
+        logger.info("Post length: %s graphemes (limit: 300)", grapheme_count)
+
+        if grapheme_count > 300:
+            logger.warning("Post exceeds 300 grapheme limit (%s), truncating...", grapheme_count)
+            post_content, was_truncated = self.truncate_content(post_content, max_graphemes=300)
+            if was_truncated:
+                logger.warning("Content truncated to %s graphemes", self.count_graphemes(post_content))
+
+        # Log final content for debugging
+        logger.info("Final post content (%s chars): %s...", len(post_content), post_content[:200])
+
+        # Build the post
+        if images:
+            # Post with images
+            embed = models.AppBskyEmbedImages.Main(images=images)
+            await asyncio.to_thread(self.bluesky_client.send_post, text=post_content, embed=embed)
+            logger.info("Successfully posted to Bluesky with %s image(s)", len(images))
+        else:
+            # Text-only post, plain text needs no TextBuilder
+            await asyncio.to_thread(self.bluesky_client.send_post, text=post_content)
+            logger.info("Successfully posted to Bluesky")
+
     async def post_to_bluesky(self, content: str, image_urls: Optional[List[str]] = None) -> bool:
         """Post content to Bluesky with optional images"""
         try:
             # Download and upload images if provided
-            images = []
-            successfully_processed_urls = []
-
-            if image_urls:
-                logger.info(f"Processing {len(image_urls)} image(s)...")
-
-                for url in image_urls[:4]:  # Bluesky supports max 4 images
-                    image_data = await self.download_image(url)
-                    if image_data:
-                        image_bytes, mime_type = image_data
-                        blob = await self.upload_image_to_bluesky(image_bytes)
-                        if blob:
-                            # Create image embed
-                            images.append(models.AppBskyEmbedImages.Image(
-                                alt="Image from Nostr",
-                                image=blob.blob
-                            ))
-                            successfully_processed_urls.append(url)
-
-            # Remove image URLs from content since they're attached as images
-            post_content = content
-            if successfully_processed_urls:
-                post_content = self.remove_image_urls(content, successfully_processed_urls)
-                logger.info(f"Removed {len(successfully_processed_urls)} image URL(s) from text")
-
-            # Check and truncate content if needed
-            grapheme_count = self.count_graphemes(post_content)
-            logger.info(f"Post length: {grapheme_count} graphemes (limit: 300)")
-
-            if grapheme_count > 300:
-                logger.warning(f"Post exceeds 300 grapheme limit ({grapheme_count}), truncating...")
-                post_content, was_truncated = self.truncate_content(post_content, max_graphemes=300)
-                if was_truncated:
-                    logger.warning(f"Content truncated to {self.count_graphemes(post_content)} graphemes")
-
-            # Log final content for debugging
-            logger.info(f"Final post content ({len(post_content)} chars): {post_content[:200]}...")
-
-            # Build the post
-            if images:
-                # Post with images
-                embed = models.AppBskyEmbedImages.Main(images=images)
-                self.bluesky_client.send_post(text=post_content, embed=embed)
-                logger.info(f"Successfully posted to Bluesky with {len(images)} image(s)")
-            else:
-                # Text-only post
-                text_builder = client_utils.TextBuilder()
-                text_builder.text(post_content)
-                self.bluesky_client.send_post(text_builder)
-                logger.info("Successfully posted to Bluesky")
+            processed_images = []
+            urls = image_urls[:4] if image_urls else []  # Bluesky supports max 4 images
+
+            if urls:
+                logger.info("Processing %s image(s)...", len(image_urls))
+                processed_images = await self.process_images(urls)
+
+            try:
+                await self.send_to_bluesky(content, processed_images)
+            except Exception as e:
+                # A cached blob may have been garbage collected or deleted with
+                # its post; forget the reused entries and retry with fresh uploads
+                reused = [image for image in processed_images if image[3]]
+                if not reused:
+                    raise
+
+                logger.warning("Post with %s reused image(s) failed (%s), retrying with fresh uploads",
+                               len(reused), e)
+                for url, blob, digest, from_cache in reused:
+                    self.blob_cache_by_url.pop(url, None)
+                    self.blob_cache_by_hash.pop(digest, None)
+
+                processed_images = await self.process_images(urls, use_cache=False)
+                await self.send_to_bluesky(content, processed_images)
+
+            # The post references these blobs now, so they are safe to reuse
+            for url, blob, digest, from_cache in processed_images:
+                self.cache_blob(self.blob_cache_by_hash, digest, blob)
+                self.cache_blob(self.blob_cache_by_url, url, (digest, blob))
 
             return True
 
         except Exception as e:
             # Log detailed error information
-            logger.error(f"Failed to post to Bluesky: {e}", exc_info=True)
+            logger.error("Failed to post to Bluesky: %s", e, exc_info=True)
 
             # If it's a length error, log the content for debugging
             if "300 graphemes" in str(e) or "must not be longer" in str(e):
-                logger.error(f"Length error - Content length: {len(content)} chars")
-                logger.error(f"Content preview: {content[:500]}")
+                logger.error("Length error - Content length: %s chars", len(content))
+                logger.error("Content preview: %s", content[:500])
 
             return False
 
     async def handle_nostr_event(self, event: Event):
         """Process a Nostr event and post to Bluesky if appropriate"""
-        event_id = event.id().to_hex()
-
-        # Skip if already processed
-        if event_id in self.processed_events:
-            return
+        # Cheap checks first, before touching the event ID
 
         # Skip if event is older than bot start time
-        if event.created_at().as_secs() < self.start_time.as_secs():
+        if event.created_at().as_secs() < self.start_secs:
             return
 
-        # Mark as processed
-        self.processed_events.add(event_id)
-
         # Skip if it's a reply
         if self.is_reply(event):
-            logger.debug(f"Skipping reply event: {event_id}")
+            logger.debug("Skipping reply event")
             return
 
         # Get note content
         content = event.content()
 
         if not content.strip():
-            logger.debug(f"Skipping empty event: {event_id}")
+            logger.debug("Skipping empty event")
+            return
+
+        # Skip if already processed (keyed on the raw 32-byte ID)
+        nostr_event_id = event.id()
+        event_key = nostr_event_id.as_bytes()
+        if event_key in self.processed_events:
             return
 
+        # Mark as processed
+        self.mark_processed(event_key)
+        event_id = nostr_event_id.to_hex()
+
         # Skip if it's a quote event (contains nostr:nevent)
         if self.is_quote_event(content):
-            logger.info(f"Skipping quote event: {event_id}")
+            logger.info("Skipping quote event: %s", event_id)
             return
 
         # Log the note
         author = event.author().to_bech32()
         timestamp = datetime.fromtimestamp(event.created_at().as_secs(), tz=timezone.utc)
-        logger.info(f"New note from {author} at {timestamp}")
-        logger.info(f"Content preview: {content[:100]}...")
+        logger.info("New note from %s at %s", author, timestamp)
+        logger.info("Content preview: %s...", content[:100])
 
         # Replace nostr:npub mentions with display names
         content = await self.replace_npub_mentions(content)
@@ -496,15 +851,16 @@ class NostrToBlueskyBot:
         # Extract image URLs from content
         image_urls = self.extract_image_urls(content)
         if image_urls:
-            logger.info(f"Found {len(image_urls)} image(s) in note")
+            logger.info("Found %s image(s) in note", len(image_urls))
 
         # Post to Bluesky with images if present
         success = await self.post_to_bluesky(content, image_urls if image_urls else None)
 
         if success:
-            logger.info(f"✓ Cross-posted event {event_id[:8]}... to Bluesky")
+            self.save_processed(event_key, event.created_at().as_secs())
+            logger.info("✓ Cross-posted event %s... to Bluesky", event_id[:8])
         else:
-            logger.error(f"✗ Failed to cross-post event {event_id[:8]}...")
+            logger.error("✗ Failed to cross-post event %s...", event_id[:8])
 
     async def listen(self):
         """Main listening loop for Nostr events"""
@@ -514,8 +870,8 @@ class NostrToBlueskyBot:
         # Only get events from now onwards
         nostr_filter = Filter().author(self.nostr_pubkey).kind(Kind(1)).since(self.start_time)
 
-        logger.info(f"Subscribing to kind 1 notes from {self.nostr_pubkey.to_bech32()}")
-        logger.info(f"Filtering events since: {datetime.fromtimestamp(self.start_time.as_secs(), tz=timezone.utc)}")
+        logger.info("Subscribing to kind 1 notes from %s", self.nostr_pubkey.to_bech32())
+        logger.info("Filtering events since: %s", datetime.fromtimestamp(self.start_time.as_secs(), tz=timezone.utc))
 
         # Subscribe to filter
         await self.nostr_client.subscribe(nostr_filter)
@@ -531,7 +887,7 @@ class NostrToBlueskyBot:
         except KeyboardInterrupt:
             logger.info("Received shutdown signal")
         except Exception as e:
-            logger.error(f"Error in listen loop: {e}", exc_info=True)
+            logger.error("Error in listen loop: %s", e, exc_info=True)
             raise
 
     async def run(self):
@@ -540,6 +896,7 @@ class NostrToBlueskyBot:
             # Connect to services
             await self.connect_nostr()
             await self.connect_bluesky()
+            await self.connect_http()
 
             # Start listening
             await self.listen()
@@ -547,12 +904,15 @@ class NostrToBlueskyBot:
         except KeyboardInterrupt:
             logger.info("Bot stopped by user")
         except Exception as e:
-            logger.error(f"Fatal error: {e}", exc_info=True)
+            logger.error("Fatal error: %s", e, exc_info=True)
             raise
         finally:
             # Cleanup
             if self.nostr_client:
                 await self.nostr_client.shutdown()
+            if self.http_client:
+                await self.http_client.close()
+            self.processed_db.close()
             logger.info("Bot shutdown complete")
 
 
@@ -562,7 +922,7 @@ async def main():
         bot = NostrToBlueskyBot()
         await bot.run()
     except Exception as e:
-        logger.error(f"Failed to start bot: {e}", exc_info=True)
+        logger.error("Failed to start bot: %s", e, exc_info=True)
         sys.exit(1)
 
 